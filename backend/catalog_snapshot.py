@@ -0,0 +1,149 @@
+"""Versioned, immutable catalog snapshots.
+
+File layout: MAGIC, 8-byte little-endian header length, JSON header, body. The body holds each
+table as one pre-serialized JSON array; the header maps every table (and every row id) to the
+(offset, length) of its bytes in the body, so list and detail responses are plain slices.
+A CURRENT file in the snapshot directory names the live snapshot and is swapped atomically.
+"""
+import os
+import json
+import mmap
+import hashlib
+from datetime import datetime, timezone
+from typing import Optional
+
+MAGIC = b"VCATSNAP1\n"
+POINTER_FILE = "CURRENT"
+SNAPSHOT_DIR = os.environ.get(
+    "CATALOG_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots")
+)
+CATALOG_TABLES = ("lessons", "theory", "sheet_music", "care_guides")
+FILTER_FIELDS = {"sheet_music": ("difficulty", "composer")}
+
+def _replace_atomically(path: str, data: bytes):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _check_span(span, size: int, what: str):
+    if not (isinstance(span, list) and len(span) == 2 and all(isinstance(n, int) and n >= 0 for n in span)
+            and span[0] + span[1] <= size):
+        raise ValueError(f"invalid {what} span {span!r}")
+
+def _validate_header(header, body_size: int):
+    """Raise ValueError unless every field and (offset, length) span readers rely on is present and in bounds."""
+    if not isinstance(header, dict) or not isinstance(header.get("version"), str) or not isinstance(header.get("tables"), dict):
+        raise ValueError("snapshot header lacks version or tables")
+    for table, entry in header["tables"].items():
+        if not isinstance(entry, dict) or not isinstance(entry.get("items"), dict) or not isinstance(entry.get("filters"), dict):
+            raise ValueError(f"snapshot table {table} lacks items or filters")
+        _check_span(entry.get("list"), body_size, f"{table} list")
+        for item_id, span in entry["items"].items():
+            _check_span(span, body_size, f"{table} item {item_id}")
+        for field, values in entry["filters"].items():
+            if not isinstance(values, dict) or not all(isinstance(ids, list) for ids in values.values()):
+                raise ValueError(f"snapshot table {table} has an invalid {field} filter")
+
+def write_snapshot(tables: dict, directory: str = SNAPSHOT_DIR, keep: int = 3) -> str:
+    """Serialize `tables` ({name: ordered rows}) into a new snapshot, point CURRENT at it and prune old ones."""
+    body = bytearray()
+    index = {}
+    for table, rows in tables.items():
+        start = len(body)
+        items = {}
+        filters = {field: {} for field in FILTER_FIELDS.get(table, ())}
+        body += b"["
+        for i, row in enumerate(rows):
+            if i:
+                body += b","
+            data = json.dumps(row, separators=(",", ":")).encode()
+            items[row["id"]] = [len(body), len(data)]
+            body += data
+            for field, values in filters.items():
+                values.setdefault(str(row.get(field)), []).append(row["id"])
+        body += b"]"
+        index[table] = {"list": [start, len(body) - start], "items": items, "filters": filters}
+
+    created_at = datetime.now(timezone.utc)
+    version = f"{created_at.strftime('%Y%m%dT%H%M%SZ')}-{hashlib.sha256(body).hexdigest()[:12]}"
+    header = json.dumps({"version": version, "created_at": created_at.isoformat(), "tables": index}).encode()
+
+    os.makedirs(directory, exist_ok=True)
+    name = f"catalog-{version}.snap"
+    _replace_atomically(os.path.join(directory, name), MAGIC + len(header).to_bytes(8, "little") + header + bytes(body))
+    _replace_atomically(os.path.join(directory, POINTER_FILE), name.encode())
+
+    snapshots = sorted(f for f in os.listdir(directory) if f.startswith("catalog-") and f.endswith(".snap"))
+    for old in snapshots[:-keep]:
+        if old != name:
+            os.remove(os.path.join(directory, old))
+    return os.path.join(directory, name)
+
+class CatalogSnapshot:
+    """Read-only view over a memory-mapped snapshot. Returned slices are memoryviews into the map;
+    the map stays open for as long as any slice (or this object) is referenced."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        if view[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        header_start = len(MAGIC) + 8
+        header_len = int.from_bytes(view[len(MAGIC):header_start], "little")
+        header = json.loads(bytes(view[header_start:header_start + header_len]))
+        body = view[header_start + header_len:]
+        _validate_header(header, len(body))
+        self.path = path
+        self.version = header["version"]
+        self.created_at = header.get("created_at")
+        self.tables = header["tables"]
+        self.body = body
+        self._rows = {}
+        self._rows_by_id = {}
+
+    def list(self, table: str) -> memoryview:
+        offset, length = self.tables[table]["list"]
+        return self.body[offset:offset + length]
+
+    def item(self, table: str, item_id: str) -> Optional[memoryview]:
+        entry = self.tables[table]["items"].get(item_id)
+        if entry is None:
+            return None
+        return self.body[entry[0]:entry[0] + entry[1]]
+
+    def select(self, table: str, **filters) -> bytes:
+        """JSON array of the rows whose FILTER_FIELDS values equal every given (non-empty) filter, in catalog order."""
+        ids = None
+        for field, value in filters.items():
+            if value:
+                matched = set(self.tables[table]["filters"][field].get(value, ()))
+                ids = matched if ids is None else ids & matched
+        if ids is None:
+            return bytes(self.list(table))
+        items = self.tables[table]["items"]
+        return b"[" + b",".join(self.item(table, i) for i in items if i in ids) + b"]"
+
+    def rows(self, table: str) -> list:
+        """Decoded rows, parsed once per snapshot for callers that need Python objects."""
+        if table not in self._rows:
+            rows = json.loads(bytes(self.list(table)))
+            if not isinstance(rows, list) or not all(isinstance(row, dict) and "id" in row for row in rows):
+                raise ValueError(f"snapshot table {table} has rows without an id")
+            self._rows_by_id[table] = {row["id"]: row for row in rows}
+            self._rows[table] = rows
+        return self._rows[table]
+
+    def row(self, table: str, item_id: str) -> Optional[dict]:
+        self.rows(table)
+        return self._rows_by_id[table].get(item_id)
+
+def current_snapshot_name(directory: str = SNAPSHOT_DIR) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, POINTER_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
@@ -1,20 +1,51 @@
 import os
+import io
+import re
+import csv
+import json
+import codecs
+import heapq
 import uuid
+import hashlib
+import time
+import asyncio
+import logging
+import numpy as np
+from collections import OrderedDict
 from datetime import datetime, timezone, timedelta
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from dotenv import load_dotenv
 from supabase import create_client, Client
-from pydantic import BaseModel
-from typing import Optional
+from postgrest.exceptions import APIError
+from pydantic import BaseModel, ValidationError
+from typing import Optional, AsyncIterator
+from catalog_snapshot import CatalogSnapshot, CATALOG_TABLES, SNAPSHOT_DIR, current_snapshot_name
 
 load_dotenv()
 
+logger = logging.getLogger("virtuoso")
+
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
+UPSTREAM_MAX_CONCURRENCY = int(os.environ.get("UPSTREAM_MAX_CONCURRENCY", "8"))
+UPSTREAM_MAX_QUEUE = int(os.environ.get("UPSTREAM_MAX_QUEUE", "64"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.environ.get("UPSTREAM_QUEUE_TIMEOUT", "2"))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get("UPSTREAM_READ_TIMEOUT", "5"))
+UPSTREAM_WRITE_TIMEOUT = float(os.environ.get("UPSTREAM_WRITE_TIMEOUT", "10"))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", "30"))
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", "1000"))
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_ERRORS = 100
+IMPORT_MAX_RECORD_CHARS = 64 * 1024
+MAX_CACHED_USERS = int(os.environ.get("MAX_CACHED_USERS", "10000"))
+CATALOG_SNAPSHOT_POLL_SECONDS = float(os.environ.get("CATALOG_SNAPSHOT_POLL_SECONDS", "5"))
+
 app = FastAPI(title="Virtuoso - Violin Learning API")
 
 app.add_middleware(
@@ -42,213 +73,1135 @@ class ProgressUpdate(BaseModel):
     item_type: str
     completed: bool
 
+class ProgressReview(BaseModel):
+    item_id: str
+    item_type: str
+
+class ProgressRecord(ProgressUpdate):
+    reviews: int = 0
+    reviewed_at: Optional[str] = None
+
 class ScheduleCreate(BaseModel):
     day_of_week: int  # 0-6
     time: str
     duration_minutes: int
     focus_area: Optional[str] = "General Practice"
 
+# ─── Upstream ───
+class UpstreamUnavailable(Exception):
+    pass
+
+class UpstreamRejected(Exception):
+    """Upstream answered but refused the request itself (bad data, constraint violation): a client error."""
+
+    def __init__(self, status_code: int, code: str):
+        super().__init__(code)
+        self.status_code = status_code
+        self.code = code
+
+def rejection_status(error: APIError) -> Optional[int]:
+    """HTTP status to surface for a client-caused APIError, or None if the fault is ours or upstream's.
+
+    Clients never write SQL, so only bad data (SQLSTATE 22), constraint violations (23) and malformed
+    requests (PGRST1xx) are theirs. Schema, auth and JWT errors (42, PGRST2xx/3xx, non-JSON 401/403)
+    mean a missing migration or bad credentials and must show up as an outage.
+    """
+    code = str(error.code or "")
+    if code[:2] == "23":
+        return 409
+    if code[:2] == "22" or code.startswith("PGRST1"):
+        return 400
+    return None
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half_open (one probe) -> closed."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+        if self.state == "half_open" and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+upstream_limiter = asyncio.Semaphore(UPSTREAM_MAX_CONCURRENCY)
+upstream_stats = {"waiting": 0, "in_flight": 0, "rejected": 0, "timeouts": 0, "errors": 0}
+
+# Last good result of each catalog query, served while upstream is unavailable
+stale_catalog = {}
+
+async def execute(query, write: bool = False):
+    """Run a blocking Supabase query off the event loop, bounded by the limiter, deadline and breaker."""
+    if not breaker.allow():
+        upstream_stats["rejected"] += 1
+        raise UpstreamUnavailable("circuit open")
+    # allow() only lets a single caller through while half open: the probe
+    is_probe = breaker.state == "half_open"
+    try:
+        return await _execute(query, write)
+    finally:
+        # Also covers cancellation (e.g. a client dropping a streamed export), which
+        # would otherwise leave the breaker waiting forever for this probe to report.
+        if is_probe:
+            breaker.probe_in_flight = False
+
+async def _execute(query, write: bool):
+    if upstream_stats["waiting"] >= UPSTREAM_MAX_QUEUE:
+        upstream_stats["rejected"] += 1
+        raise UpstreamUnavailable("upstream queue full")
+
+    upstream_stats["waiting"] += 1
+    try:
+        await asyncio.wait_for(upstream_limiter.acquire(), timeout=UPSTREAM_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        upstream_stats["rejected"] += 1
+        raise UpstreamUnavailable("timed out waiting for upstream slot")
+    finally:
+        upstream_stats["waiting"] -= 1
+
+    # The slot is only released once the worker thread actually finishes, so an
+    # abandoned (timed out) call still counts against the concurrency limit.
+    upstream_stats["in_flight"] += 1
+    future = asyncio.get_running_loop().run_in_executor(None, query.execute)
+
+    def _release(_):
+        upstream_stats["in_flight"] -= 1
+        upstream_limiter.release()
+
+    future.add_done_callback(_release)
+    try:
+        result = await asyncio.wait_for(
+            asyncio.shield(future), timeout=UPSTREAM_WRITE_TIMEOUT if write else UPSTREAM_READ_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        upstream_stats["timeouts"] += 1
+        breaker.record_failure()
+        raise UpstreamUnavailable("upstream timed out")
+    except APIError as e:
+        status_code = rejection_status(e)
+        if status_code is None:
+            upstream_stats["errors"] += 1
+            breaker.record_failure()
+            logger.warning("Upstream error: %r", e)
+            raise UpstreamUnavailable("upstream error") from e
+        # Upstream is healthy, it just refused this request
+        breaker.record_success()
+        raise UpstreamRejected(status_code, str(e.code)) from e
+    except Exception as e:
+        upstream_stats["errors"] += 1
+        breaker.record_failure()
+        logger.warning("Upstream error: %r", e)
+        raise UpstreamUnavailable("upstream error") from e
+    breaker.record_success()
+    return result
+
+async def execute_catalog(key: str, query):
+    """Catalog reads fall back to the last good result when upstream is unavailable."""
+    try:
+        result = await execute(query)
+    except UpstreamUnavailable:
+        if key in stale_catalog:
+            return stale_catalog[key]
+        raise
+    if result.data:
+        stale_catalog[key] = result.data
+        for row in result.data:
+            if isinstance(row.get("content"), str):
+                compile_content(row["content"])
+    return result.data
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable_handler(request: Request, exc: UpstreamUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Service temporarily unavailable ({exc})"},
+        headers={"Retry-After": str(int(BREAKER_RESET_SECONDS))},
+    )
+
+@app.exception_handler(UpstreamRejected)
+async def upstream_rejected_handler(request: Request, exc: UpstreamRejected):
+    detail = "Conflicts with existing data" if exc.status_code == 409 else "Request rejected as invalid"
+    return JSONResponse(status_code=exc.status_code, content={"detail": f"{detail} (code {exc.code})"})
+
+# ─── Structured Content ───
+STEP_MARKER = re.compile(r"(?:^|\s)(\d+)\)\s+")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z])")
+NOTE_SEQUENCE = re.compile(r"\b[A-G][#b]?(?:-[A-G][#b]?)+(?![\w#])")
+STRING_MENTION = re.compile(r"\b([GDAE]) strings?\b")
+STRING_LIST = re.compile(r"\(([GDAE](?:,\s*[GDAE])+)\)")
+WARNING_PREFIXES = ("Never", "Avoid", "Don't", "Do not")
+EXERCISE_PREFIXES = ("Practice", "Start with", "Start on", "Start by")
+TIP_PREFIXES = ("Focus on", "Use ", "Try ", "Remember", "Always")
+
+# Compiled documents keyed by sha1 of the raw content blob
+compiled_content = {}
+
+def classify_sentence(sentence: str) -> str:
+    if sentence.startswith(WARNING_PREFIXES) or "never attempt" in sentence:
+        return "warning"
+    if sentence.startswith(EXERCISE_PREFIXES):
+        return "exercise"
+    if sentence.startswith(TIP_PREFIXES):
+        return "tip"
+    return "text"
+
+def compile_content(content: str) -> dict:
+    """Parse a content blob into ordered typed blocks plus referenced notes/strings, once per distinct blob."""
+    content_hash = hashlib.sha1(content.encode()).hexdigest()
+    if content_hash in compiled_content:
+        return compiled_content[content_hash]
+
+    blocks = []
+    parts = STEP_MARKER.split(content.strip())
+    # parts = [prefix, n1, body1, n2, body2, ...]; each step body may trail into plain sentences
+    segments = [(None, parts[0])] + [("step", body) for body in parts[2::2]]
+    for kind, segment in segments:
+        for i, sentence in enumerate(SENTENCE_END.split(segment.strip())):
+            if not sentence:
+                continue
+            block_type = "step" if kind == "step" and i == 0 else classify_sentence(sentence)
+            if block_type == "text" and blocks and blocks[-1]["type"] == "text":
+                blocks[-1]["value"] += " " + sentence
+            else:
+                blocks.append({"type": block_type, "value": sentence})
+
+    notes = []
+    for sequence in NOTE_SEQUENCE.findall(content):
+        for note in sequence.split("-"):
+            if note not in notes:
+                notes.append(note)
+    strings = STRING_MENTION.findall(content)
+    for group in STRING_LIST.findall(content):
+        strings.extend(s.strip() for s in group.split(","))
+    strings = [s for s in "GDAE" if s in strings]
+
+    compiled_content[content_hash] = {
+        "content": blocks,
+        "content_hash": content_hash,
+        "references": {"notes": notes, "strings": strings},
+    }
+    return compiled_content[content_hash]
+
+def structured(row: dict) -> dict:
+    if not isinstance(row.get("content"), str):
+        return row
+    return {**row, **compile_content(row["content"])}
+
+# ─── Users ───
+DEFAULT_USER_ID = "default"
+USER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def get_user_id(x_user_id: Optional[str] = Header(None)) -> str:
+    """Learner identity from the X-User-Id header; rows created before multi-user support belong to "default"."""
+    if x_user_id is None:
+        return DEFAULT_USER_ID
+    if not USER_ID_PATTERN.match(x_user_id):
+        raise HTTPException(status_code=400, detail="Invalid X-User-Id")
+    return x_user_id
+
+class UserState:
+    """Derived per-user data; any field may be None/unbuilt and is recomputed on next read."""
+
+    def __init__(self):
+        self.generation = 0
+        self.stats = None
+        self.stats_day = None
+        self.bookmarks = None
+        self.recommendations = RecommendationEngine()
+
+    def invalidate(self, bookmarks: bool = False):
+        # Reads that started before a write compare generations and skip caching their result
+        self.generation += 1
+        self.stats = None
+        if bookmarks:
+            self.bookmarks = None
+
+class UserStates:
+    """LRU of UserState so memory stays bounded regardless of how many learners exist."""
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self.entries = OrderedDict()
+
+    def get(self, user_id: str) -> UserState:
+        state = self.entries.get(user_id)
+        if state is None:
+            state = self.entries[user_id] = UserState()
+            if len(self.entries) > self.max_users:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(user_id)
+        return state
+
+    def peek(self, user_id: str) -> Optional[UserState]:
+        return self.entries.get(user_id)
+
+    def invalidate(self, user_id: str):
+        self.entries.pop(user_id, None)
+
+user_states = UserStates(MAX_CACHED_USERS)
+
+# ─── Catalog Snapshot ───
+class SnapshotJSONResponse(Response):
+    """Sends a pre-serialized JSON slice of the catalog snapshot without copying or re-encoding it."""
+    media_type = "application/json"
+
+    def render(self, content) -> memoryview:
+        return content
+
+catalog_snapshot: Optional[CatalogSnapshot] = None
+
+def refresh_catalog_snapshot() -> bool:
+    """Load the snapshot named by CURRENT if it changed. Swapping is a single rebinding, so each
+    request (which reads the global once) sees either the old or the new snapshot, never a mix."""
+    global catalog_snapshot
+    name = current_snapshot_name()
+    if not name or (catalog_snapshot and os.path.basename(catalog_snapshot.path) == name):
+        return False
+    snapshot = CatalogSnapshot(os.path.join(SNAPSHOT_DIR, name))
+    missing = [table for table in CATALOG_TABLES if table not in snapshot.tables]
+    if missing:
+        raise ValueError(f"snapshot {name} is missing {', '.join(missing)}")
+    for table in CATALOG_TABLES:
+        for row in snapshot.rows(table):
+            if isinstance(row.get("content"), str):
+                compile_content(row["content"])
+    catalog_snapshot = snapshot
+    logger.info("Serving catalog snapshot %s", snapshot.version)
+    return True
+
+async def watch_catalog_snapshot():
+    while True:
+        await asyncio.sleep(CATALOG_SNAPSHOT_POLL_SECONDS)
+        try:
+            refresh_catalog_snapshot()
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable catalog snapshot: %s", e)
+        except Exception:
+            # Anything escaping here would silently end hot-swapping for the life of the process
+            logger.exception("Failed to refresh catalog snapshot")
+
+@app.on_event("startup")
+async def load_catalog_snapshot():
+    try:
+        refresh_catalog_snapshot()
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable catalog snapshot: %s", e)
+    except Exception:
+        logger.exception("Failed to load catalog snapshot; serving the catalog from Supabase")
+    app.state.snapshot_watcher = asyncio.create_task(watch_catalog_snapshot())
+
+def snapshot_list(snapshot: CatalogSnapshot, table: str, format: Optional[str]):
+    if format == "structured":
+        return [structured(row) for row in snapshot.rows(table)]
+    return SnapshotJSONResponse(snapshot.list(table))
+
+def snapshot_item(snapshot: CatalogSnapshot, table: str, item_id: str, format: Optional[str], not_found: str):
+    data = snapshot.item(table, item_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    return structured(snapshot.row(table, item_id)) if format == "structured" else SnapshotJSONResponse(data)
+
+async def catalog_rows(table: str) -> list:
+    """Full ordered catalog table, from the snapshot when one is loaded."""
+    snapshot = catalog_snapshot
+    if snapshot:
+        return snapshot.rows(table)
+    return await execute_catalog(f"{table}:all", supabase.table(table).select("*").order("order"))
+
+async def catalog_count(table: str) -> int:
+    """Row count of a catalog table; without a snapshot only ids are fetched."""
+    snapshot = catalog_snapshot
+    if snapshot:
+        return len(snapshot.tables[table]["items"])
+    return len(await execute_catalog(f"{table}:ids", supabase.table(table).select("id")))
+
 # ─── Health ───
 @app.get("/api/health")
 async def health():
     return {"status": "ok", "service": "Virtuoso Violin API"}
 
+@app.get("/api/health/upstream")
+async def upstream_health():
+    return {
+        "breaker_state": breaker.state,
+        "consecutive_failures": breaker.failures,
+        "max_concurrency": UPSTREAM_MAX_CONCURRENCY,
+        "queue_depth": upstream_stats["waiting"],
+        "in_flight": upstream_stats["in_flight"],
+        "rejected": upstream_stats["rejected"],
+        "timeouts": upstream_stats["timeouts"],
+        "errors": upstream_stats["errors"],
+        "stale_catalog_entries": len(stale_catalog),
+        "cached_users": len(user_states.entries),
+        "catalog_snapshot": catalog_snapshot.version if catalog_snapshot else None,
+    }
+
 # ─── Lessons ───
 @app.get("/api/lessons")
-async def get_lessons():
-    result = supabase.table("lessons").select("*").order("order").execute()
-    return result.data
+async def get_lessons(format: Optional[str] = None):
+    snapshot = catalog_snapshot
+    if snapshot:
+        return snapshot_list(snapshot, "lessons", format)
+    data = await execute_catalog("lessons", supabase.table("lessons").select("*").order("order"))
+    return [structured(row) for row in data] if format == "structured" else data
 
 @app.get("/api/lessons/{lesson_id}")
-async def get_lesson(lesson_id: str):
-    result = supabase.table("lessons").select("*").eq("id", lesson_id).execute()
-    if not result.data:
+async def get_lesson(lesson_id: str, format: Optional[str] = None):
+    snapshot = catalog_snapshot
+    if snapshot:
+        return snapshot_item(snapshot, "lessons", lesson_id, format, "Lesson not found")
+    data = await execute_catalog(f"lessons:{lesson_id}", supabase.table("lessons").select("*").eq("id", lesson_id))
+    if not data:
         raise HTTPException(status_code=404, detail="Lesson not found")
-    return result.data[0]
+    return structured(data[0]) if format == "structured" else data[0]
 
 # ─── Music Theory ───
 @app.get("/api/theory")
-async def get_theory_topics():
-    result = supabase.table("theory").select("*").order("order").execute()
-    return result.data
+async def get_theory_topics(format: Optional[str] = None):
+    snapshot = catalog_snapshot
+    if snapshot:
+        return snapshot_list(snapshot, "theory", format)
+    data = await execute_catalog("theory", supabase.table("theory").select("*").order("order"))
+    return [structured(row) for row in data] if format == "structured" else data
 
 @app.get("/api/theory/{topic_id}")
-async def get_theory_topic(topic_id: str):
-    result = supabase.table("theory").select("*").eq("id", topic_id).execute()
-    if not result.data:
+async def get_theory_topic(topic_id: str, format: Optional[str] = None):
+    snapshot = catalog_snapshot
+    if snapshot:
+        return snapshot_item(snapshot, "theory", topic_id, format, "Topic not found")
+    data = await execute_catalog(f"theory:{topic_id}", supabase.table("theory").select("*").eq("id", topic_id))
+    if not data:
         raise HTTPException(status_code=404, detail="Topic not found")
-    return result.data[0]
+    return structured(data[0]) if format == "structured" else data[0]
 
 # ─── Sheet Music ───
 @app.get("/api/sheet-music")
 async def get_sheet_music(difficulty: Optional[str] = None, composer: Optional[str] = None):
+    snapshot = catalog_snapshot
+    if snapshot:
+        return SnapshotJSONResponse(snapshot.select("sheet_music", difficulty=difficulty, composer=composer))
     query = supabase.table("sheet_music").select("*")
     if difficulty:
         query = query.eq("difficulty", difficulty)
     if composer:
         query = query.eq("composer", composer)
-    result = query.order("order").execute()
-    return result.data
+    return await execute_catalog(f"sheet_music?{difficulty}&{composer}", query.order("order"))
 
 @app.get("/api/sheet-music/{piece_id}")
 async def get_sheet_music_piece(piece_id: str):
-    result = supabase.table("sheet_music").select("*").eq("id", piece_id).execute()
-    if not result.data:
+    snapshot = catalog_snapshot
+    if snapshot:
+        return snapshot_item(snapshot, "sheet_music", piece_id, None, "Piece not found")
+    data = await execute_catalog(f"sheet_music:{piece_id}", supabase.table("sheet_music").select("*").eq("id", piece_id))
+    if not data:
         raise HTTPException(status_code=404, detail="Piece not found")
-    return result.data[0]
+    return data[0]
 
 # ─── Care & Maintenance ───
 @app.get("/api/care-guides")
-async def get_care_guides():
-    result = supabase.table("care_guides").select("*").order("order").execute()
-    return result.data
+async def get_care_guides(format: Optional[str] = None):
+    snapshot = catalog_snapshot
+    if snapshot:
+        return snapshot_list(snapshot, "care_guides", format)
+    data = await execute_catalog("care_guides", supabase.table("care_guides").select("*").order("order"))
+    return [structured(row) for row in data] if format == "structured" else data
 
 @app.get("/api/care-guides/{guide_id}")
-async def get_care_guide(guide_id: str):
-    result = supabase.table("care_guides").select("*").eq("id", guide_id).execute()
-    if not result.data:
+async def get_care_guide(guide_id: str, format: Optional[str] = None):
+    snapshot = catalog_snapshot
+    if snapshot:
+        return snapshot_item(snapshot, "care_guides", guide_id, format, "Guide not found")
+    data = await execute_catalog(f"care_guides:{guide_id}", supabase.table("care_guides").select("*").eq("id", guide_id))
+    if not data:
         raise HTTPException(status_code=404, detail="Guide not found")
-    return result.data[0]
+    return structured(data[0]) if format == "structured" else data[0]
 
 # ─── Practice Logs ───
 @app.get("/api/practice-logs")
-async def get_practice_logs():
-    result = supabase.table("practice_logs").select("*").order("date", desc=True).execute()
+async def get_practice_logs(user_id: str = Depends(get_user_id)):
+    result = await execute(supabase.table("practice_logs").select("*").eq("user_id", user_id).order("date", desc=True))
     return result.data
 
 @app.post("/api/practice-logs", status_code=201)
-async def create_practice_log(log: PracticeLogCreate):
+async def create_practice_log(log: PracticeLogCreate, user_id: str = Depends(get_user_id)):
     log_data = {
         "id": str(uuid.uuid4()),
+        "user_id": user_id,
         "date": log.date,
         "duration_minutes": log.duration_minutes,
         "notes": log.notes,
         "lesson_id": log.lesson_id,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    result = supabase.table("practice_logs").insert(log_data).execute()
+    result = await execute(supabase.table("practice_logs").insert(log_data), write=True)
+    state = user_states.peek(user_id)
+    if state:
+        state.invalidate()
+        state.recommendations.on_log(log.lesson_id, log.date)
     return result.data[0]
 
 @app.delete("/api/practice-logs/{log_id}")
-async def delete_practice_log(log_id: str):
-    result = supabase.table("practice_logs").delete().eq("id", log_id).execute()
+async def delete_practice_log(log_id: str, user_id: str = Depends(get_user_id)):
+    result = await execute(supabase.table("practice_logs").delete().eq("user_id", user_id).eq("id", log_id), write=True)
     if not result.data:
         raise HTTPException(status_code=404, detail="Log not found")
+    state = user_states.peek(user_id)
+    if state:
+        state.invalidate()
+        state.recommendations.on_log_deleted()
     return {"status": "deleted"}
 
 # ─── Progress ───
 @app.get("/api/progress")
-async def get_progress():
-    result = supabase.table("progress").select("*").execute()
+async def get_progress(user_id: str = Depends(get_user_id)):
+    result = await execute(supabase.table("progress").select("*").eq("user_id", user_id))
     return result.data
 
 @app.post("/api/progress")
-async def update_progress(update: ProgressUpdate):
-    existing = supabase.table("progress").select("*").eq("item_id", update.item_id).eq("item_type", update.item_type).execute()
+async def update_progress(update: ProgressUpdate, user_id: str = Depends(get_user_id)):
     now = datetime.now(timezone.utc).isoformat()
-    if existing.data:
-        supabase.table("progress").update({
-            "completed": update.completed,
-            "updated_at": now
-        }).eq("item_id", update.item_id).eq("item_type", update.item_type).execute()
-    else:
-        supabase.table("progress").insert({
-            "id": str(uuid.uuid4()),
-            "item_id": update.item_id,
-            "item_type": update.item_type,
-            "completed": update.completed,
-            "updated_at": now
-        }).execute()
-    
-    result = supabase.table("progress").select("*").eq("item_id", update.item_id).eq("item_type", update.item_type).execute()
+    # Single statement on the unique (user_id, item_type, item_id) index, so concurrent toggles
+    # can't race into a duplicate insert; id is left to the column default and kept on update
+    data = {
+        "user_id": user_id,
+        "item_id": update.item_id,
+        "item_type": update.item_type,
+        "completed": update.completed,
+        "updated_at": now
+    }
+    if not update.completed:
+        # Un-completing starts the review schedule over
+        data.update(reviews=0, reviewed_at=None)
+    result = await execute(supabase.table("progress").upsert(data, on_conflict="user_id,item_type,item_id"), write=True)
+    state = user_states.peek(user_id)
+    if state:
+        state.invalidate()
+        state.recommendations.on_progress(update.item_type, update.item_id, update.completed, parse_day(now))
+    return result.data[0]
+
+@app.post("/api/progress/review")
+async def review_progress(review: ProgressReview, user_id: str = Depends(get_user_id)):
+    """Record a spaced-repetition review of a completed item."""
+    existing = await execute(supabase.table("progress").select("*").eq("user_id", user_id).eq("item_id", review.item_id).eq("item_type", review.item_type).eq("completed", True))
+    if not existing.data:
+        raise HTTPException(status_code=404, detail="Item not completed")
+    now = datetime.now(timezone.utc).isoformat()
+    result = await execute(supabase.table("progress").update({
+        "reviews": (existing.data[0].get("reviews") or 0) + 1,
+        "reviewed_at": now
+    }).eq("user_id", user_id).eq("id", existing.data[0]["id"]), write=True)
+    state = user_states.peek(user_id)
+    if state:
+        state.invalidate()
+        state.recommendations.on_review(review.item_type, review.item_id, parse_day(now))
     return result.data[0]
 
 # ─── Bookmarks ───
 @app.get("/api/bookmarks")
-async def get_bookmarks():
-    result = supabase.table("bookmarks").select("*").order("created_at", desc=True).execute()
+async def get_bookmarks(user_id: str = Depends(get_user_id)):
+    state = user_states.get(user_id)
+    if state.bookmarks is not None:
+        return state.bookmarks
+    generation = state.generation
+    result = await execute(supabase.table("bookmarks").select("*").eq("user_id", user_id).order("created_at", desc=True))
+    if state.generation == generation:
+        state.bookmarks = result.data
     return result.data
 
 @app.post("/api/bookmarks", status_code=201)
-async def add_bookmark(bookmark: BookmarkCreate):
-    existing = supabase.table("bookmarks").select("*").eq("item_id", bookmark.item_id).eq("item_type", bookmark.item_type).execute()
+async def add_bookmark(bookmark: BookmarkCreate, user_id: str = Depends(get_user_id)):
+    existing = await execute(supabase.table("bookmarks").select("*").eq("user_id", user_id).eq("item_id", bookmark.item_id).eq("item_type", bookmark.item_type))
     if existing.data:
         raise HTTPException(status_code=400, detail="Already bookmarked")
     bm_data = {
         "id": str(uuid.uuid4()),
+        "user_id": user_id,
         "item_id": bookmark.item_id,
         "item_type": bookmark.item_type,
         "title": bookmark.title,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    result = supabase.table("bookmarks").insert(bm_data).execute()
+    result = await execute(supabase.table("bookmarks").insert(bm_data), write=True)
+    state = user_states.peek(user_id)
+    if state:
+        state.invalidate(bookmarks=True)
     return result.data[0]
 
 @app.delete("/api/bookmarks/{bookmark_id}")
-async def remove_bookmark(bookmark_id: str):
-    result = supabase.table("bookmarks").delete().eq("id", bookmark_id).execute()
+async def remove_bookmark(bookmark_id: str, user_id: str = Depends(get_user_id)):
+    result = await execute(supabase.table("bookmarks").delete().eq("user_id", user_id).eq("id", bookmark_id), write=True)
     if not result.data:
         raise HTTPException(status_code=404, detail="Bookmark not found")
+    state = user_states.peek(user_id)
+    if state:
+        state.invalidate(bookmarks=True)
     return {"status": "deleted"}
 
 # ─── Schedule ───
 @app.get("/api/schedule")
-async def get_schedule():
-    result = supabase.table("schedule").select("*").execute()
+async def get_schedule(user_id: str = Depends(get_user_id)):
+    result = await execute(supabase.table("schedule").select("*").eq("user_id", user_id))
     return result.data
 
 @app.post("/api/schedule", status_code=201)
-async def create_schedule(entry: ScheduleCreate):
+async def create_schedule(entry: ScheduleCreate, user_id: str = Depends(get_user_id)):
     entry_data = {
         "id": str(uuid.uuid4()),
+        "user_id": user_id,
         "day_of_week": entry.day_of_week,
         "time": entry.time,
         "duration_minutes": entry.duration_minutes,
         "focus_area": entry.focus_area,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    result = supabase.table("schedule").insert(entry_data).execute()
+    result = await execute(supabase.table("schedule").insert(entry_data), write=True)
     return result.data[0]
 
 @app.delete("/api/schedule/{entry_id}")
-async def delete_schedule(entry_id: str):
-    result = supabase.table("schedule").delete().eq("id", entry_id).execute()
+async def delete_schedule(entry_id: str, user_id: str = Depends(get_user_id)):
+    result = await execute(supabase.table("schedule").delete().eq("user_id", user_id).eq("id", entry_id), write=True)
     if not result.data:
         raise HTTPException(status_code=404, detail="Entry not found")
     return {"status": "deleted"}
 
+# ─── Export / Import ───
+# table -> (validation model, exported columns, timestamp column)
+USER_DATA_TABLES = {
+    "practice_logs": (PracticeLogCreate, ["id", "date", "duration_minutes", "notes", "lesson_id", "created_at"], "created_at"),
+    "progress": (ProgressRecord, ["id", "item_id", "item_type", "completed", "reviews", "reviewed_at", "updated_at"], "updated_at"),
+    "bookmarks": (BookmarkCreate, ["id", "item_id", "item_type", "title", "created_at"], "created_at"),
+    "schedule": (ScheduleCreate, ["id", "day_of_week", "time", "duration_minutes", "focus_area", "created_at"], "created_at"),
+}
+
+# Keys enforced by unique indexes that imports merge on. Rows without a natural key merge on
+# (user_id, id), so an upsert can only ever update the importing user's own rows.
+UPSERT_CONFLICT_KEYS = {
+    "practice_logs": "user_id,id",
+    "progress": "user_id,item_type,item_id",
+    "bookmarks": "user_id,item_type,item_id",
+    "schedule": "user_id,id",
+}
+
+# Exported ids are kept when restoring one's own backup. Ids that belong to another user are
+# re-derived from it, so importing another account's export copies its rows (idempotently)
+# instead of colliding with or taking over the originals.
+IMPORT_ID_NAMESPACE = uuid.UUID("0b7d5f52-3c8e-4f0a-9d61-5a2e8c4b7f13")
+
+def parse_tables(tables: Optional[str], format: str) -> list:
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    names = [t.strip() for t in tables.split(",")] if tables else list(USER_DATA_TABLES)
+    unknown = [t for t in names if t not in USER_DATA_TABLES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown table(s): {', '.join(unknown)}")
+    if format == "csv" and len(names) != 1:
+        raise HTTPException(status_code=400, detail="csv export/import requires exactly one table")
+    return names
+
+async def iter_table(table: str, user_id: str) -> AsyncIterator[dict]:
+    """Keyset-paginate one user's rows by id so each upstream call and the resident set stay bounded."""
+    columns = ",".join(USER_DATA_TABLES[table][1])
+    last_id = None
+    while True:
+        query = supabase.table(table).select(columns).eq("user_id", user_id).order("id").limit(EXPORT_PAGE_SIZE)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        page = (await execute(query)).data
+        for row in page:
+            yield row
+        if len(page) < EXPORT_PAGE_SIZE:
+            return
+        last_id = page[-1]["id"]
+
+async def export_ndjson(tables: list, user_id: str) -> AsyncIterator[str]:
+    for table in tables:
+        async for row in iter_table(table, user_id):
+            yield json.dumps({"table": table, "data": row}) + "\n"
+
+async def export_csv(table: str, user_id: str) -> AsyncIterator[str]:
+    columns = USER_DATA_TABLES[table][1]
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    async for row in iter_table(table, user_id):
+        writer.writerow(row)
+        if buf.tell() >= 64 * 1024:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+@app.get("/api/export")
+async def export_data(format: str = "ndjson", tables: Optional[str] = None, user_id: str = Depends(get_user_id)):
+    names = parse_tables(tables, format)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d")
+    if format == "csv":
+        body, media_type, filename = export_csv(names[0], user_id), "text/csv", f"virtuoso-{names[0]}-{stamp}.csv"
+    else:
+        body, media_type, filename = export_ndjson(names, user_id), "application/x-ndjson", f"virtuoso-export-{stamp}.ndjson"
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+class CSVRecordScanner:
+    """Follows the csv module's quoting rules across physical lines, so a record only ends at a
+    newline outside a quoted field. A quote in the middle of an unquoted field is literal."""
+
+    def __init__(self):
+        self.in_quotes = False
+
+    def feed(self, line: str) -> bool:
+        """Consume one physical line; return True if it completes the current record."""
+        if '"' not in line:
+            return not self.in_quotes
+        in_quotes = self.in_quotes
+        field_start = not in_quotes
+        closed = False
+        for ch in line:
+            if in_quotes:
+                if ch == '"':
+                    in_quotes = False
+                    closed = True
+                continue
+            if ch == '"' and (field_start or closed):
+                # Opening quote, or the second half of an escaped "" inside a quoted field
+                in_quotes = True
+            field_start = ch == ","
+            closed = False
+        self.in_quotes = in_quotes
+        return not in_quotes
+
+async def iter_lines(request: Request) -> AsyncIterator[Optional[str]]:
+    """Physical lines of the request body as it streams in; None for a line over IMPORT_MAX_RECORD_CHARS."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    overflow = False
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield None if overflow else line.rstrip("\r")
+            overflow = False
+        if len(pending) > IMPORT_MAX_RECORD_CHARS:
+            # Drop the rest of this line as it arrives instead of buffering it
+            overflow = True
+            pending = ""
+    pending += decoder.decode(b"", final=True)
+    if overflow or pending.strip():
+        yield None if overflow else pending.rstrip("\r")
+
+async def iter_records(request: Request, quoted: bool = False) -> AsyncIterator[tuple]:
+    """Yield (first line number, text) for each record of the request body as it streams in.
+
+    With `quoted`, records follow CSV quoting and may span lines. Text is None for a record longer
+    than IMPORT_MAX_RECORD_CHARS; scanning restarts at the next line, so memory stays bounded."""
+    scanner = CSVRecordScanner() if quoted else None
+    record = []
+    size = 0
+    first_line = line_no = 0
+    async for line in iter_lines(request):
+        line_no += 1
+        if not record:
+            first_line = line_no
+        if line is None or size + len(line) > IMPORT_MAX_RECORD_CHARS:
+            yield first_line, None
+            record, size = [], 0
+            if scanner:
+                scanner.in_quotes = False
+            continue
+        record.append(line)
+        size += len(line) + 1
+        if scanner is None or scanner.feed(line):
+            yield first_line, "\n".join(record)
+            record, size = [], 0
+    if record:
+        yield first_line, "\n".join(record)
+
+def build_row(table: str, fields: dict, user_id: str) -> dict:
+    model, columns, timestamp = USER_DATA_TABLES[table]
+    item = model.model_validate({k: v for k, v in fields.items() if v not in ("", None)})
+    return {
+        "id": fields.get("id") or str(uuid.uuid4()),
+        "user_id": user_id,
+        **item.model_dump(),
+        timestamp: fields.get(timestamp) or datetime.now(timezone.utc).isoformat(),
+    }
+
+@app.post("/api/import")
+async def import_data(request: Request, format: str = "ndjson", tables: Optional[str] = None,
+                      user_id: str = Depends(get_user_id)):
+    names = parse_tables(tables, format)
+    # name -> {conflict key: (line number, row)}; a later row with the same key replaces the earlier
+    # one, since Postgres rejects an upsert batch that touches the same conflicting row twice
+    batches = {name: {} for name in names}
+    imported = 0
+    replaced = 0  # rows overridden by a later row with the same key in the same batch
+    failed = 0
+    errors = []
+
+    def report(line_no: int, error: str, count: int = 1, to_line: Optional[int] = None):
+        nonlocal failed
+        failed += count
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append({"line": line_no, "error": error} if to_line is None
+                          else {"line": line_no, "to_line": to_line, "error": error})
+
+    async def upsert(name: str, rows: list):
+        await execute(supabase.table(name).upsert(rows, on_conflict=UPSERT_CONFLICT_KEYS[name]), write=True)
+        user_states.invalidate(user_id)
+
+    async def rekey_foreign_ids(name: str, rows: list):
+        ids = [row["id"] for row in rows]
+        query = supabase.table(name).select("id").in_("id", ids).neq("user_id", user_id)
+        foreign = {row["id"] for row in (await execute(query)).data}
+        for row in rows:
+            if row["id"] in foreign:
+                row["id"] = str(uuid.uuid5(IMPORT_ID_NAMESPACE, f"{user_id}:{name}:{row['id']}"))
+
+    async def flush(name):
+        nonlocal imported
+        entries = list(batches[name].values())
+        batches[name] = {}
+        if not entries:
+            return
+        try:
+            await rekey_foreign_ids(name, [row for _, row in entries])
+            await upsert(name, [row for _, row in entries])
+            imported += len(entries)
+        except UpstreamRejected:
+            # Some row is unacceptable to the database; retry one by one to find which
+            for line_no, row in entries:
+                try:
+                    await upsert(name, [row])
+                    imported += 1
+                except UpstreamRejected as e:
+                    report(line_no, f"rejected by database (code {e.code})")
+                except UpstreamUnavailable as e:
+                    report(line_no, f"not saved: {e}")
+        except UpstreamUnavailable as e:
+            lines = [line_no for line_no, _ in entries]
+            report(min(lines), f"batch not saved: {e}", count=len(entries), to_line=max(lines))
+
+    header = None
+    async for line_no, record in iter_records(request, quoted=format == "csv"):
+        if record is None:
+            report(line_no, f"record exceeds {IMPORT_MAX_RECORD_CHARS} characters")
+            continue
+        if not record.strip():
+            continue
+        try:
+            if format == "csv":
+                values = next(csv.reader([record]))
+                if header is None:
+                    header = values
+                    continue
+                name, fields = names[0], dict(zip(header, values))
+            else:
+                parsed = json.loads(record)
+                if not isinstance(parsed, dict):
+                    parsed = {}
+                name, fields = parsed.get("table"), parsed.get("data")
+                if name not in batches or not isinstance(fields, dict):
+                    raise ValueError(f"expected {{\"table\": one of {names}, \"data\": {{...}}}}")
+            row = build_row(name, fields, user_id)
+        except (ValueError, ValidationError, csv.Error) as e:
+            report(line_no, str(e))
+            continue
+        key = tuple(row[column] for column in UPSERT_CONFLICT_KEYS[name].split(","))
+        if key in batches[name]:
+            replaced += 1
+        batches[name][key] = (line_no, row)
+        if len(batches[name]) >= IMPORT_BATCH_SIZE:
+            await flush(name)
+
+    for name in names:
+        await flush(name)
+    return {"imported": imported, "replaced": replaced, "failed": failed, "errors": errors}
+
+# ─── Recommendations ───
+LEVEL_RANKS = {"beginner": 0, "intermediate": 1, "advanced": 2}
+ITEM_TYPE_WEIGHTS = {"lesson": 10, "theory": 5, "sheet_music": 0}
+REVIEW_INTERVALS_DAYS = [1, 3, 7, 14, 30, 60]
+RECENT_PRACTICE_DAYS = 14
+
+def parse_day(value: str):
+    try:
+        return datetime.fromisoformat(value).date()
+    except (ValueError, TypeError):
+        return datetime.strptime(value[:10], "%Y-%m-%d").date()
+
+def try_parse_day(value) -> Optional[object]:
+    """parse_day for stored/imported values, which are free-form strings: None when unparsable."""
+    try:
+        return parse_day(value)
+    except (ValueError, TypeError):
+        return None
+
+class RecommendationEngine:
+    """Keeps every catalog item in one of two lazily-invalidated heaps: incomplete items ordered by
+    score ("learning"), completed items ordered by spaced-repetition due date ("reviews").
+    Progress and practice-log events rescore only the entries they affect."""
+
+    def __init__(self):
+        self.ready = False
+        self.lock = asyncio.Lock()
+        # Bumped by every event, even before the engine is ready, so a build can tell whether
+        # events arrived while it was reading upstream
+        self.generation = 0
+
+    def build(self, lessons: list, theory: list, sheet_music: list, progress: list, logs: list):
+        self.items = {}
+        self.by_category = {}
+        for item_type, rows, category in (("lesson", lessons, None), ("theory", theory, "theory"),
+                                          ("sheet_music", sheet_music, "repertoire")):
+            for row in rows:
+                key = (item_type, row["id"])
+                level = row.get("level") or row.get("difficulty")
+                self.items[key] = {
+                    "title": row.get("title"),
+                    "rank": LEVEL_RANKS.get(level) if item_type != "theory" else None,
+                    "category": category or row.get("category"),
+                    "order": row.get("order") or 0,
+                }
+                self.by_category.setdefault(self.items[key]["category"], set()).add(key)
+
+        self.completed = {}  # key -> {"day": date of completion/last review, "reviews": int}, as stored in progress
+        self.practiced = {}  # lesson id -> {"count": int, "last": date}
+        self.category_last = {}  # category -> last practiced date
+        self.today = datetime.now(timezone.utc).date()
+        for row in progress:
+            key = (row.get("item_type"), row.get("item_id"))
+            if row.get("completed") and key in self.items:
+                # A completion with a missing/garbled timestamp is still a completion; start its reviews today
+                day = try_parse_day(row.get("reviewed_at") or row.get("updated_at")) or self.today
+                self.completed[key] = {"day": day, "reviews": row.get("reviews") or 0}
+        for row in logs:
+            day = try_parse_day(row.get("date"))
+            if day:
+                self._record_log(row.get("lesson_id"), day)
+
+        self.current_rank = self._current_rank()
+        self._rebuild_heaps()
+        self.ready = True
+
+    def _current_rank(self) -> int:
+        pending = [item["rank"] for key, item in self.items.items()
+                   if key[0] == "lesson" and key not in self.completed and item["rank"] is not None]
+        return min(pending) if pending else max(LEVEL_RANKS.values())
+
+    def _rebuild_heaps(self):
+        self.version = {}
+        self.learning = []
+        self.reviews = []
+        for key in self.items:
+            self._rescore(key)
+
+    def _rescore(self, key: tuple):
+        version = self.version.get(key, 0) + 1
+        self.version[key] = version
+        if key in self.completed:
+            heapq.heappush(self.reviews, (self._due(key), version, key))
+        else:
+            score, _ = self._score(key)
+            heapq.heappush(self.learning, (-score, version, key))
+        if len(self.learning) + len(self.reviews) > 4 * len(self.items) + 16:
+            self._rebuild_heaps()
+
+    def _due(self, key: tuple):
+        state = self.completed[key]
+        return state["day"] + timedelta(days=REVIEW_INTERVALS_DAYS[min(state["reviews"], len(REVIEW_INTERVALS_DAYS) - 1)])
+
+    def _score(self, key: tuple) -> tuple:
+        item = self.items[key]
+        rank = self.current_rank if item["rank"] is None else item["rank"]
+        score = 100 + ITEM_TYPE_WEIGHTS[key[0]] - 25 * abs(rank - self.current_rank) - item["order"]
+        reason = "Next up at your level" if rank == self.current_rank else "Coming up"
+        last = self.category_last.get(item["category"])
+        if last and (self.today - last).days <= RECENT_PRACTICE_DAYS:
+            score += 5
+            reason = f"Builds on your recent {item['category'].replace('_', ' ')} practice"
+        if key[0] == "lesson" and key[1] in self.practiced:
+            score += 15
+            reason = "Continue where you left off"
+        return score, reason
+
+    def _record_log(self, lesson_id: Optional[str], day) -> set:
+        """Apply one practice log; return the keys whose priority may have changed."""
+        key = ("lesson", lesson_id)
+        if key not in self.items:
+            return set()
+        practiced = self.practiced.setdefault(lesson_id, {"count": 0, "last": day})
+        practiced["count"] += 1
+        practiced["last"] = max(practiced["last"], day)
+        category = self.items[key]["category"]
+        if day > self.category_last.get(category, day - timedelta(days=1)):
+            self.category_last[category] = day
+            return self.by_category[category]
+        return {key}
+
+    def _apply(self, affected: set):
+        rank = self._current_rank()
+        if rank != self.current_rank:
+            self.current_rank = rank
+            self._rebuild_heaps()
+            return
+        for key in affected:
+            self._rescore(key)
+
+    def on_progress(self, item_type: str, item_id: str, completed: bool, day):
+        self.generation += 1
+        key = (item_type, item_id)
+        if not self.ready or key not in self.items:
+            return
+        if not completed:
+            self.completed.pop(key, None)
+        elif key not in self.completed:
+            self.completed[key] = {"day": day, "reviews": 0}
+        elif not self.completed[key]["reviews"]:
+            # Re-completing moves updated_at, which is what an unreviewed completion is scheduled from
+            self.completed[key]["day"] = day
+        self._apply({key})
+
+    def on_review(self, item_type: str, item_id: str, day):
+        self.generation += 1
+        key = (item_type, item_id)
+        if not self.ready or key not in self.completed:
+            return
+        self.completed[key] = {"day": day, "reviews": self.completed[key]["reviews"] + 1}
+        self._apply({key})
+
+    def on_log(self, lesson_id: Optional[str], date: str):
+        self.generation += 1
+        day = try_parse_day(date)
+        if not self.ready or not day:
+            return
+        self._apply(self._record_log(lesson_id, day))
+
+    def on_log_deleted(self):
+        # Undoing a log would need the "last practiced" dates it replaced; rebuild on next use instead
+        self.generation += 1
+        self.ready = False
+
+    def _take(self, heap: list, limit: int, stop=None) -> list:
+        """Pop up to `limit` live entries (optionally only those with priority <= stop), then restore them."""
+        taken = []
+        while heap and len(taken) < limit:
+            priority, version, key = heap[0]
+            if self.version.get(key) != version:
+                heapq.heappop(heap)
+                continue
+            if stop is not None and priority > stop:
+                break
+            taken.append(heapq.heappop(heap))
+        for entry in taken:
+            heapq.heappush(heap, entry)
+        return taken
+
+    def recommend(self, limit: int) -> list:
+        today = datetime.now(timezone.utc).date()
+        if today != self.today:
+            # Recency bonuses are relative to self.today; rescore once per day so heap order
+            # and the reasons reported below stay consistent
+            self.today = today
+            self._rebuild_heaps()
+        due = self._take(self.reviews, limit, stop=today)
+        learning = self._take(self.learning, limit)
+        review_slots = max(limit // 2, limit - len(learning))
+        picked = due[:review_slots]
+        picked += learning[:limit - len(picked)]
+
+        results = []
+        for priority, _, key in picked:
+            item = self.items[key]
+            entry = {"item_id": key[1], "item_type": key[0], "title": item["title"]}
+            if key in self.completed:
+                overdue = (today - priority).days
+                entry.update(kind="review", score=round(60 + min(overdue, 30) * 2, 1), due=priority.isoformat(),
+                             reason="Due for review" if not overdue else f"Review overdue by {overdue} day(s)")
+            else:
+                _, reason = self._score(key)
+                entry.update(kind="learn", score=-priority, reason=reason)
+            results.append(entry)
+        return results
+
+@app.get("/api/recommendations")
+async def get_recommendations(limit: int = 10, user_id: str = Depends(get_user_id)):
+    limit = max(1, min(limit, 50))
+    recommendations = user_states.get(user_id).recommendations
+    async with recommendations.lock:
+        attempts = 0
+        while not recommendations.ready:
+            generation = recommendations.generation
+            lessons = await catalog_rows("lessons")
+            theory = await catalog_rows("theory")
+            sheet_music = await catalog_rows("sheet_music")
+            progress = (await execute(supabase.table("progress").select("*").eq("user_id", user_id))).data
+            logs = [row async for row in iter_table("practice_logs", user_id)]
+            recommendations.build(lessons, theory, sheet_music, progress, logs)
+            attempts += 1
+            if recommendations.generation != generation and attempts < 3:
+                # Writes landed while we were reading and may be missing from what we read
+                recommendations.ready = False
+    return recommendations.recommend(limit)
+
 # ─── Stats ───
 @app.get("/api/stats")
-async def get_stats():
-    total_lessons = len(supabase.table("lessons").select("id").execute().data)
-    completed_lessons = len(supabase.table("progress").select("id").eq("item_type", "lesson").eq("completed", True).execute().data)
-    total_theory = len(supabase.table("theory").select("id").execute().data)
-    completed_theory = len(supabase.table("progress").select("id").eq("item_type", "theory").eq("completed", True).execute().data)
+async def get_stats(user_id: str = Depends(get_user_id)):
+    state = user_states.get(user_id)
+    today = datetime.now(timezone.utc).date()
+    if state.stats is not None and state.stats_day == today:
+        return state.stats
+    generation = state.generation
+
+    total_lessons = await catalog_count("lessons")
+    total_theory = await catalog_count("theory")
+    total_sheet_music = await catalog_count("sheet_music")
+
+    completed = (await execute(supabase.table("progress").select("item_type").eq("user_id", user_id).eq("completed", True))).data
+    completed_lessons = sum(1 for row in completed if row["item_type"] == "lesson")
+    completed_theory = sum(1 for row in completed if row["item_type"] == "theory")
     
-    logs = supabase.table("practice_logs").select("duration_minutes").execute().data
-    total_practice_minutes = sum(log.get("duration_minutes", 0) for log in logs)
+    logs = (await execute(supabase.table("practice_logs").select("duration_minutes,date").eq("user_id", user_id))).data
+    total_practice_minutes = sum(log.get("duration_minutes") or 0 for log in logs)
     
     # Calculate streak
-    practice_dates = supabase.table("practice_logs").select("date").order("date", desc=True).execute().data
     streak = 0
-    if practice_dates:
-        today = datetime.now(timezone.utc).date()
-        dates = sorted(set(d["date"] for d in practice_dates), reverse=True)
-        for i, date_str in enumerate(dates):
-            try:
-                d = datetime.fromisoformat(date_str).date()
-            except (ValueError, TypeError):
-                d = datetime.strptime(date_str, "%Y-%m-%d").date()
+    if logs:
+        days = sorted({try_parse_day(log["date"]) for log in logs} - {None}, reverse=True)
+        for i, d in enumerate(days):
             expected = today if i == 0 else (today - timedelta(days=i))
             if d == expected or (i == 0 and (today - d).days <= 1):
                 streak += 1
             else:
                 break
 
-    total_sheet_music = len(supabase.table("sheet_music").select("id").execute().data)
-    bookmarks_count = len(supabase.table("bookmarks").select("id").execute().data)
+    bookmarks_count = len((await execute(supabase.table("bookmarks").select("id").eq("user_id", user_id))).data)
 
-    return {
+    stats = {
         "total_lessons": total_lessons,
         "completed_lessons": completed_lessons,
         "total_theory": total_theory,
@@ -258,3 +1211,200 @@ async def get_stats():
         "total_sheet_music": total_sheet_music,
         "bookmarks_count": bookmarks_count
     }
+    if state.generation == generation:
+        state.stats = stats
+        state.stats_day = today
+    return stats
+
+# ─── Tuner ───
+TUNINGS = {
+    "standard": {"name": "Standard (G-D-A-E)", "strings": [("G", 196.00), ("D", 293.66), ("A", 440.00), ("E", 659.25)]},
+    "scordatura": {"name": "Scordatura (G-D-A-Eb)", "strings": [("G", 196.00), ("D", 293.66), ("A", 440.00), ("Eb", 622.25)]},
+    "cross": {"name": "Cross Tuning (G-D-G-D)", "strings": [("G", 196.00), ("D", 293.66), ("G", 392.00), ("D", 587.33)]},
+}
+# Per-tuning string targets in log2 Hz, so readings are a subtract into a preallocated buffer
+TUNING_LOG2_TARGETS = {key: np.log2([f for _, f in t["strings"]]) for key, t in TUNINGS.items()}
+MAX_STRINGS = max(len(t["strings"]) for t in TUNINGS.values())
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+SAMPLE_FORMATS = {"f32": np.dtype("<f4"), "s16": np.dtype("<i2")}
+
+class PitchDetector:
+    """FFT-based YIN over a sliding window. All working buffers are allocated once per session."""
+
+    def __init__(self, sample_rate: int, frame_size: int = 2048, fmin: float = 80.0, fmax: float = 2000.0,
+                 threshold: float = 0.15, silence_rms: float = 0.01):
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.window = frame_size // 2
+        self.tau_max = min(frame_size - self.window, int(sample_rate / fmin) + 1)
+        self.tau_min = max(2, int(sample_rate / fmax))
+        self.threshold = threshold
+        self.silence_rms = silence_rms
+        self.fft_size = 1 << int(np.ceil(np.log2(frame_size + self.window)))
+
+        self.samples = np.zeros(frame_size)
+        self.padded = np.zeros(self.fft_size)
+        self.spectrum = np.empty(self.fft_size // 2 + 1, dtype=complex)
+        self.window_spectrum = np.empty_like(self.spectrum)
+        self.acf = np.empty(self.fft_size)
+        self.squares = np.empty(frame_size)
+        self.energy = np.empty(frame_size + 1)
+        self.diff = np.empty(self.tau_max)
+        self.cmnd = np.empty(self.tau_max)
+        self.scratch = np.empty(self.tau_max)
+        self.invalid = np.empty(self.tau_max, dtype=bool)
+        self.taus = np.arange(self.tau_max, dtype=float)
+        # Dip mask over taus tau_min..tau_max-2 (each needs both neighbours)
+        self.is_min = np.empty(max(self.tau_max - self.tau_min - 1, 0), dtype=bool)
+        self.is_min_scratch = np.empty_like(self.is_min)
+        self.cents = np.empty(MAX_STRINGS)
+        self.cents_abs = np.empty(MAX_STRINGS)
+
+    def push(self, chunk: np.ndarray, scale: float = 1.0):
+        """Slide `chunk` into the analysis window, multiplying the new samples by `scale`."""
+        n = min(len(chunk), self.frame_size)
+        if not n:
+            return
+        if n < self.frame_size:
+            self.samples[:-n] = self.samples[n:]
+        tail = self.samples[-n:]
+        tail[:] = chunk[-n:]
+        if scale != 1.0:
+            tail *= scale
+
+    def describe(self, frequency: float, tuning: str) -> dict:
+        return describe_pitch(frequency, tuning, self.cents, self.cents_abs)
+
+    def detect(self) -> Optional[tuple]:
+        """Return (frequency, clarity) for the current window, or None when silent/unvoiced."""
+        x = self.samples
+        w = self.window
+        if np.sqrt(np.dot(x, x) / self.frame_size) < self.silence_rms:
+            return None
+
+        # acf[tau] = sum_{j<w} x[j] * x[j + tau], via one forward FFT of each operand
+        self.padded[:self.frame_size] = x
+        self.padded[self.frame_size:] = 0
+        np.fft.rfft(self.padded, out=self.spectrum)
+        self.padded[w:] = 0
+        np.fft.rfft(self.padded, out=self.window_spectrum)
+        np.conjugate(self.window_spectrum, out=self.window_spectrum)
+        np.multiply(self.spectrum, self.window_spectrum, out=self.spectrum)
+        np.fft.irfft(self.spectrum, n=self.fft_size, out=self.acf)
+
+        # YIN difference function from sliding-window energy and the autocorrelation
+        self.energy[0] = 0
+        np.square(x, out=self.squares)
+        np.cumsum(self.squares, out=self.energy[1:])
+        tau_max = self.tau_max
+        np.subtract(self.energy[w:w + tau_max], self.energy[:tau_max], out=self.diff)
+        self.diff += self.diff[0]
+        np.multiply(self.acf[:tau_max], 2, out=self.scratch)
+        self.diff -= self.scratch
+        np.maximum(self.diff, 0, out=self.diff)
+
+        # Cumulative mean normalized difference
+        np.cumsum(self.diff, out=self.cmnd)
+        self.cmnd[0] = 1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            np.multiply(self.diff[1:], self.taus[1:], out=self.scratch[1:])
+            np.divide(self.scratch[1:], self.cmnd[1:], out=self.cmnd[1:])
+        np.isfinite(self.cmnd, out=self.invalid)
+        np.logical_not(self.invalid, out=self.invalid)
+        np.copyto(self.cmnd, 1.0, where=self.invalid)
+
+        # First dip below the threshold that is a local minimum
+        d = self.cmnd
+        lo = self.tau_min
+        is_min, scratch = self.is_min, self.is_min_scratch
+        if not len(is_min):
+            return None
+        np.less(d[lo:-1], self.threshold, out=is_min)
+        np.less_equal(d[lo:-1], d[lo - 1:-2], out=scratch)
+        is_min &= scratch
+        np.less_equal(d[lo:-1], d[lo + 1:], out=scratch)
+        is_min &= scratch
+        first = int(np.argmax(is_min))
+        if not is_min[first]:
+            return None
+        tau = first + lo
+
+        # Parabolic interpolation around the minimum for sub-sample precision
+        a, b, c = d[tau - 1], d[tau], d[tau + 1]
+        denom = a - 2 * b + c
+        shift = 0.5 * (a - c) / denom if denom else 0.0
+        return self.sample_rate / (tau + shift), float(1 - b)
+
+def describe_pitch(frequency: float, tuning: str, cents: Optional[np.ndarray] = None,
+                   cents_abs: Optional[np.ndarray] = None) -> dict:
+    """Nearest string and its offset in cents; `cents`/`cents_abs` are optional MAX_STRINGS scratch buffers."""
+    strings = TUNINGS[tuning]["strings"]
+    log2_targets = TUNING_LOG2_TARGETS[tuning]
+    n = len(strings)
+    cents = np.empty(n) if cents is None else cents[:n]
+    cents_abs = np.empty(n) if cents_abs is None else cents_abs[:n]
+    log2_frequency = np.log2(frequency)
+    np.subtract(log2_frequency, log2_targets, out=cents)
+    cents *= 1200
+    idx = int(np.argmin(np.abs(cents, out=cents_abs)))
+    midi = int(round(69 + 12 * (log2_frequency - np.log2(440.0))))
+    return {
+        "frequency": round(frequency, 2),
+        "note": f"{NOTE_NAMES[midi % 12]}{midi // 12 - 1}",
+        "string": strings[idx][0],
+        "string_index": idx,
+        "target_frequency": strings[idx][1],
+        "cents": round(float(cents[idx]), 1),
+    }
+
+@app.get("/api/tuner/tunings")
+async def get_tunings():
+    return [{"id": key, "name": t["name"], "strings": [{"string": s, "frequency": f} for s, f in t["strings"]]}
+            for key, t in TUNINGS.items()]
+
+@app.websocket("/api/tuner/ws")
+async def tuner_ws(websocket: WebSocket, sample_rate: int = 44100, frame_size: int = 2048,
+                   encoding: str = "f32", tuning: str = "standard"):
+    """Binary messages are little-endian mono PCM chunks; each one yields a JSON reading.
+    Text messages are JSON settings updates, e.g. {"tuning": "cross"}."""
+    await websocket.accept()
+    if (encoding not in SAMPLE_FORMATS or tuning not in TUNINGS or not 8000 <= sample_rate <= 96000
+            or frame_size not in (1024, 2048, 4096, 8192)):
+        await websocket.close(code=1003, reason="Invalid tuner parameters")
+        return
+
+    detector = PitchDetector(sample_rate, frame_size)
+    dtype = SAMPLE_FORMATS[encoding]
+    scale = 1.0 / 32768 if dtype.kind == "i" else 1.0
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("text") is not None:
+                try:
+                    tuning_update = json.loads(message["text"]).get("tuning", tuning)
+                except (ValueError, AttributeError):
+                    tuning_update = None
+                if tuning_update not in TUNINGS:
+                    await websocket.send_json({"error": "Unknown tuning"})
+                    continue
+                tuning = tuning_update
+                await websocket.send_json({"tuning": tuning})
+                continue
+
+            payload = message.get("bytes") or b""
+            if len(payload) % dtype.itemsize:
+                await websocket.send_json({"error": f"Frame length must be a multiple of {dtype.itemsize} bytes"})
+                continue
+            started = time.perf_counter()
+            chunk = np.frombuffer(memoryview(payload), dtype=dtype)
+            detector.push(chunk, scale)
+            pitch = detector.detect()
+            reading = detector.describe(pitch[0], tuning) if pitch else {"frequency": None}
+            if pitch:
+                reading["clarity"] = round(pitch[1], 3)
+            reading["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            await websocket.send_json(reading)
+    except WebSocketDisconnect:
+        pass
@@ -1,7 +1,9 @@
 import os
+import sys
 import uuid
 from dotenv import load_dotenv
 from supabase import create_client
+from catalog_snapshot import CATALOG_TABLES, write_snapshot
 
 load_dotenv()
 
@@ -57,6 +59,7 @@ CREATE TABLE IF NOT EXISTS care_guides (
 -- Practice logs table
 CREATE TABLE IF NOT EXISTS practice_logs (
     id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL DEFAULT 'default',
     date TEXT,
     duration_minutes INTEGER,
     notes TEXT,
@@ -67,15 +70,19 @@ CREATE TABLE IF NOT EXISTS practice_logs (
 -- Progress table
 CREATE TABLE IF NOT EXISTS progress (
     id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL DEFAULT 'default',
     item_id TEXT,
     item_type TEXT,
     completed BOOLEAN DEFAULT FALSE,
+    reviews INTEGER NOT NULL DEFAULT 0,
+    reviewed_at TIMESTAMPTZ,
     updated_at TIMESTAMPTZ DEFAULT NOW()
 );
 
 -- Bookmarks table
 CREATE TABLE IF NOT EXISTS bookmarks (
     id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL DEFAULT 'default',
     item_id TEXT,
     item_type TEXT,
     title TEXT,
@@ -85,12 +92,34 @@ CREATE TABLE IF NOT EXISTS bookmarks (
 -- Schedule table
 CREATE TABLE IF NOT EXISTS schedule (
     id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL DEFAULT 'default',
     day_of_week INTEGER,
     time TEXT,
     duration_minutes INTEGER,
     focus_area TEXT,
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
+
+-- Per-user partitioning (also migrates pre-existing single-user tables to the "default" user)
+ALTER TABLE practice_logs ADD COLUMN IF NOT EXISTS user_id TEXT NOT NULL DEFAULT 'default';
+ALTER TABLE progress ADD COLUMN IF NOT EXISTS user_id TEXT NOT NULL DEFAULT 'default';
+ALTER TABLE bookmarks ADD COLUMN IF NOT EXISTS user_id TEXT NOT NULL DEFAULT 'default';
+ALTER TABLE schedule ADD COLUMN IF NOT EXISTS user_id TEXT NOT NULL DEFAULT 'default';
+
+-- Spaced-repetition reviews of completed items
+ALTER TABLE progress ADD COLUMN IF NOT EXISTS reviews INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE progress ADD COLUMN IF NOT EXISTS reviewed_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS practice_logs_user_date_idx ON practice_logs (user_id, date DESC);
+DROP INDEX IF EXISTS practice_logs_user_id_idx;
+CREATE UNIQUE INDEX IF NOT EXISTS practice_logs_user_id_key ON practice_logs (user_id, id);
+ALTER TABLE progress ALTER COLUMN id SET DEFAULT gen_random_uuid()::text;
+CREATE UNIQUE INDEX IF NOT EXISTS progress_user_item_idx ON progress (user_id, item_type, item_id);
+CREATE INDEX IF NOT EXISTS progress_user_id_idx ON progress (user_id, id);
+CREATE UNIQUE INDEX IF NOT EXISTS bookmarks_user_item_idx ON bookmarks (user_id, item_type, item_id);
+CREATE INDEX IF NOT EXISTS bookmarks_user_created_idx ON bookmarks (user_id, created_at DESC);
+DROP INDEX IF EXISTS schedule_user_id_idx;
+CREATE UNIQUE INDEX IF NOT EXISTS schedule_user_id_key ON schedule (user_id, id);
 """
 
 # Seed data
@@ -180,7 +209,18 @@ def seed_data():
         except Exception as e:
             print(f"  ✗ {guide['title']}: {e}")
 
+def build_snapshot():
+    """Write a new catalog snapshot from the seeded tables; running API servers pick it up automatically"""
+    print("\nBuilding catalog snapshot...")
+    tables = {table: supabase.table(table).select("*").order("order").execute().data for table in CATALOG_TABLES}
+    path = write_snapshot(tables)
+    print(f"  ✓ {path} ({', '.join(f'{len(rows)} {table}' for table, rows in tables.items())})")
+
 if __name__ == "__main__":
+    if sys.argv[1:] == ["snapshot"]:
+        build_snapshot()
+        sys.exit(0)
+
     print("=" * 50)
     print("Virtuoso - Supabase Setup")
     print("=" * 50)
@@ -194,6 +234,7 @@ if __name__ == "__main__":
     response = input("\nHave you created the tables? (y/n): ")
     if response.lower() == 'y':
         seed_data()
+        build_snapshot()
         print("\n✅ Setup complete!")
     else:
         print("\nPlease create the tables first, then run this script again.")
@@ -6,8 +6,14 @@ Tests all endpoints defined in the backend server.py
 
 import requests
 import json
+import math
+import os
+import struct
 import sys
+import tempfile
 from datetime import datetime, timezone
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.client import connect
 
 class VirtuosoAPITester:
     def __init__(self):
@@ -19,10 +25,12 @@ class VirtuosoAPITester:
     def log(self, message):
         print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
 
-    def run_test(self, name, method, endpoint, expected_status=200, data=None, validate_response=None):
+    def run_test(self, name, method, endpoint, expected_status=200, data=None, validate_response=None, user_id=None):
         """Run a single API test"""
         url = f"{self.base_url}{endpoint}"
         headers = {'Content-Type': 'application/json'}
+        if user_id:
+            headers['X-User-Id'] = user_id
         
         self.tests_run += 1
         self.log(f"Testing {name}...")
@@ -80,6 +88,16 @@ class VirtuosoAPITester:
         
         return self.run_test("Health Check", "GET", "/api/health", 200, validate_response=validate_health)
 
+    def test_upstream_health_endpoint(self):
+        """Test upstream limiter/breaker monitoring endpoint"""
+        def validate_upstream(data):
+            return (data.get('breaker_state') in ('closed', 'open', 'half_open') and
+                   isinstance(data.get('queue_depth'), int) and
+                   isinstance(data.get('in_flight'), int) and
+                   'catalog_snapshot' in data)
+        
+        return self.run_test("Upstream Health", "GET", "/api/health/upstream", 200, validate_response=validate_upstream)
+
     def test_lessons_endpoints(self):
         """Test lessons endpoints"""
         self.log("\n=== TESTING LESSONS ENDPOINTS ===")
@@ -190,6 +208,18 @@ class VirtuosoAPITester:
                 200, validate_response=validate_care_detail
             )
 
+            def validate_structured_care(data):
+                return (data.get('id') == first_guide_id and
+                       isinstance(data.get('content'), list) and
+                       all('type' in block and 'value' in block for block in data['content']) and
+                       'content_hash' in data and 'references' in data)
+            
+            self.run_test(
+                f"Get Structured Care Guide ({first_guide_id})", "GET",
+                f"/api/care-guides/{first_guide_id}?format=structured",
+                200, validate_response=validate_structured_care
+            )
+
     def test_practice_logs_endpoints(self):
         """Test practice logs endpoints"""
         self.log("\n=== TESTING PRACTICE LOGS ENDPOINTS ===")
@@ -273,6 +303,19 @@ class VirtuosoAPITester:
             "Update Progress", "POST", "/api/progress", 
             200, data=progress_update_data, validate_response=validate_progress_update
         )
+        
+        # Review the completed item
+        def validate_review(data):
+            return data.get('item_id') == 'lesson-1' and data.get('reviews', 0) >= 1
+        
+        self.run_test(
+            "Review Progress", "POST", "/api/progress/review", 200,
+            data={"item_id": "lesson-1", "item_type": "lesson"}, validate_response=validate_review
+        )
+        self.run_test(
+            "Review Incomplete Item", "POST", "/api/progress/review", 404,
+            data={"item_id": "never-completed", "item_type": "lesson"}
+        )
 
     def test_schedule_endpoints(self):
         """Test schedule endpoints"""
@@ -319,6 +362,199 @@ class VirtuosoAPITester:
             "Get Stats", "GET", "/api/stats", 200, validate_response=validate_stats
         )
 
+    def test_user_isolation(self):
+        """Test that user-scoped data is partitioned by X-User-Id"""
+        self.log("\n=== TESTING USER ISOLATION ===")
+        
+        stamp = datetime.now().strftime('%H%M%S')
+        user_a, user_b = f"test-a-{stamp}", f"test-b-{stamp}"
+        success, created = self.run_test(
+            "Create Bookmark (user A)", "POST", "/api/bookmarks", 201,
+            data={"item_id": "lesson-1", "item_type": "lesson", "title": "Isolation"}, user_id=user_a
+        )
+        
+        self.run_test(
+            "Bookmarks Hidden From User B", "GET", "/api/bookmarks", 200,
+            validate_response=lambda data: isinstance(data, list) and len(data) == 0, user_id=user_b
+        )
+        
+        if success and created and 'id' in created:
+            self.run_test(
+                "Delete Bookmark As User B", "DELETE", f"/api/bookmarks/{created['id']}", 404, user_id=user_b
+            )
+            self.run_test(
+                "Delete Bookmark As User A", "DELETE", f"/api/bookmarks/{created['id']}", 200, user_id=user_a
+            )
+        
+        self.run_test("Invalid User Id", "GET", "/api/bookmarks", 400, user_id="not a valid id!")
+
+    def test_recommendations_endpoint(self):
+        """Test recommendations endpoint"""
+        self.log("\n=== TESTING RECOMMENDATIONS ENDPOINT ===")
+        
+        def validate_recommendations(data):
+            return (isinstance(data, list) and len(data) <= 5 and
+                   all(r.get('kind') in ('learn', 'review') and 'item_id' in r and 'reason' in r for r in data))
+        
+        self.run_test(
+            "Get Recommendations", "GET", "/api/recommendations?limit=5", 200, validate_response=validate_recommendations
+        )
+
+    def test_export_import_endpoints(self):
+        """Test practice history export and import"""
+        self.log("\n=== TESTING EXPORT / IMPORT ENDPOINTS ===")
+        
+        self.run_test("Export NDJSON", "GET", "/api/export?format=ndjson", 200)
+        self.run_test("Export CSV (practice logs)", "GET", "/api/export?format=csv&tables=practice_logs", 200)
+        self.run_test("Export CSV without table", "GET", "/api/export?format=csv", 400)
+        
+        self.tests_run += 1
+        self.log("Testing Import NDJSON (invalid row reported)...")
+        try:
+            body = json.dumps({"table": "practice_logs", "data": {"date": "2026-01-01"}}) + "\n"
+            response = requests.post(f"{self.base_url}/api/import?format=ndjson", data=body, timeout=10)
+            data = response.json()
+            if response.status_code == 200 and data.get('failed') == 1 and data['errors'][0]['line'] == 1:
+                self.tests_passed += 1
+                self.log("✅ Import NDJSON - invalid row reported")
+            else:
+                self.failed_tests.append(f"Import NDJSON - Unexpected response {response.status_code}: {data}")
+                self.log(f"❌ Import NDJSON - Unexpected response {response.status_code}")
+        except Exception as e:
+            self.failed_tests.append(f"Import NDJSON - Error: {str(e)}")
+            self.log(f"❌ Import NDJSON - Error: {str(e)}")
+        
+        # Round trip: restoring your own export must not duplicate anything
+        self.tests_run += 1
+        self.log("Testing Export/Import round trip...")
+        headers = {'X-User-Id': f"roundtrip-{datetime.now().strftime('%H%M%S%f')}"}
+        try:
+            log = requests.post(f"{self.base_url}/api/practice-logs", headers=headers, timeout=10,
+                                json={"date": "2026-01-02", "duration_minutes": 25, "notes": "round trip"}).json()
+            exported = requests.get(f"{self.base_url}/api/export?format=ndjson", headers=headers, timeout=10).text
+            response = requests.post(f"{self.base_url}/api/import?format=ndjson&tables=practice_logs",
+                                     data=exported, headers=headers, timeout=10)
+            data = response.json()
+            logs = requests.get(f"{self.base_url}/api/practice-logs", headers=headers, timeout=10).json()
+            if (response.status_code == 200 and data.get('imported') == 1 and data.get('failed') == 0
+                    and [(l['id'], l['duration_minutes'], l['notes']) for l in logs] == [(log['id'], 25, "round trip")]):
+                self.tests_passed += 1
+                self.log("✅ Export/Import round trip")
+            else:
+                self.failed_tests.append(f"Export/Import round trip - Unexpected result {data}, logs {logs}")
+                self.log(f"❌ Export/Import round trip - Unexpected result {response.status_code}")
+        except Exception as e:
+            self.failed_tests.append(f"Export/Import round trip - Error: {str(e)}")
+            self.log(f"❌ Export/Import round trip - Error: {str(e)}")
+
+    def test_tuner_tunings_endpoint(self):
+        """Test tuner tunings endpoint"""
+        self.log("\n=== TESTING TUNER ENDPOINTS ===")
+        
+        def validate_tunings(data):
+            return (isinstance(data, list) and
+                   any(t.get('id') == 'standard' for t in data) and
+                   all(len(t.get('strings', [])) == 4 for t in data))
+        
+        self.run_test(
+            "Get Tuner Tunings", "GET", "/api/tuner/tunings", 200, validate_response=validate_tunings
+        )
+
+    def run_ws_test(self, name, endpoint, message, validate):
+        """Send one message over the tuner WebSocket; validate gets the JSON reply or the close code"""
+        url = self.base_url.replace("https://", "wss://", 1).replace("http://", "ws://", 1) + endpoint
+        self.tests_run += 1
+        self.log(f"Testing {name}...")
+        try:
+            with connect(url, open_timeout=10, close_timeout=5) as ws:
+                try:
+                    ws.send(message)
+                    result = json.loads(ws.recv(timeout=10))
+                except ConnectionClosed as e:
+                    result = e.rcvd.code if e.rcvd else None
+            if validate(result):
+                self.tests_passed += 1
+                self.log(f"✅ {name}")
+            else:
+                self.failed_tests.append(f"{name} - Unexpected result: {result}")
+                self.log(f"❌ {name} - Unexpected result: {result}")
+        except Exception as e:
+            self.failed_tests.append(f"{name} - Error: {str(e)}")
+            self.log(f"❌ {name} - Error: {str(e)}")
+
+    def test_tuner_websocket(self):
+        """Test live pitch detection over the tuner WebSocket"""
+        samples = [0.5 * math.sin(2 * math.pi * 440.0 * i / 44100) for i in range(2048)]
+        frame = struct.pack(f"<{len(samples)}f", *samples)
+
+        def validate_reading(data):
+            return (isinstance(data, dict) and data.get('string') == 'A' and
+                   data.get('cents') is not None and abs(data['cents']) < 5)
+
+        self.run_ws_test("Tuner WS 440 Hz f32 frame", "/api/tuner/ws?sample_rate=44100&encoding=f32",
+                         frame, validate_reading)
+        self.run_ws_test("Tuner WS bad encoding", "/api/tuner/ws?encoding=f64", frame,
+                         lambda result: result == 1003)
+        self.run_ws_test("Tuner WS bad frame size", "/api/tuner/ws?frame_size=1000", frame,
+                         lambda result: result == 1003)
+        self.run_ws_test("Tuner WS partial sample", "/api/tuner/ws?encoding=f32", b"\x00\x00\x00",
+                         lambda data: isinstance(data, dict) and 'multiple of 4 bytes' in data.get('error', ''))
+
+    def check(self, name, fn):
+        """Run a local (non-HTTP) check; fn returns truthy on success"""
+        self.tests_run += 1
+        self.log(f"Testing {name}...")
+        try:
+            if fn():
+                self.tests_passed += 1
+                self.log(f"✅ {name}")
+            else:
+                self.failed_tests.append(f"{name} - Check failed")
+                self.log(f"❌ {name} - Check failed")
+        except Exception as e:
+            self.failed_tests.append(f"{name} - Error: {str(e)}")
+            self.log(f"❌ {name} - Error: {str(e)}")
+
+    def test_catalog_snapshot(self):
+        """Test catalog snapshot files round-trip and reject malformed headers"""
+        self.log("\n=== TESTING CATALOG SNAPSHOT ===")
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+        from catalog_snapshot import MAGIC, CatalogSnapshot, write_snapshot, current_snapshot_name
+
+        tables = {
+            "lessons": [{"id": "l1", "title": "Open Strings", "order": 1}, {"id": "l2", "title": "Scales", "order": 2}],
+            "sheet_music": [
+                {"id": "s1", "title": "Minuet", "difficulty": "beginner", "composer": "Bach"},
+                {"id": "s2", "title": "Gavotte", "difficulty": "intermediate", "composer": "Bach"},
+                {"id": "s3", "title": "Meditation", "difficulty": "intermediate", "composer": "Massenet"},
+            ],
+        }
+        directory = tempfile.mkdtemp()
+        path = write_snapshot(tables, directory)
+        snapshot = CatalogSnapshot(path)
+
+        self.check("Snapshot CURRENT pointer", lambda: current_snapshot_name(directory) == os.path.basename(path))
+        self.check("Snapshot list", lambda: json.loads(bytes(snapshot.list("lessons"))) == tables["lessons"])
+        self.check("Snapshot item", lambda: json.loads(bytes(snapshot.item("sheet_music", "s2"))) == tables["sheet_music"][1]
+                   and snapshot.item("sheet_music", "missing") is None)
+        self.check("Snapshot select", lambda: (
+            json.loads(snapshot.select("sheet_music", composer="Bach", difficulty="intermediate")) == [tables["sheet_music"][1]]
+            and [r["id"] for r in json.loads(snapshot.select("sheet_music", composer="Bach"))] == ["s1", "s2"]
+            and json.loads(snapshot.select("sheet_music", composer="Nobody")) == []
+            and json.loads(snapshot.select("sheet_music", composer="")) == tables["sheet_music"]))
+
+        def rejects_empty_header():
+            bad = os.path.join(directory, "bad.snap")
+            with open(bad, "wb") as f:
+                f.write(MAGIC + (2).to_bytes(8, "little") + b"{}")
+            try:
+                CatalogSnapshot(bad)
+            except ValueError:
+                return True
+            return False
+
+        self.check("Snapshot rejects malformed header", rejects_empty_header)
+
     def run_all_tests(self):
         """Run all backend tests"""
         self.log("🎻 Starting Virtuoso Backend API Tests...")
@@ -326,6 +562,7 @@ class VirtuosoAPITester:
         
         # Test all endpoints
         self.test_health_endpoint()
+        self.test_upstream_health_endpoint()
         self.test_lessons_endpoints()
         self.test_theory_endpoints()
         self.test_sheet_music_endpoints()
@@ -335,6 +572,12 @@ class VirtuosoAPITester:
         self.test_progress_endpoints()
         self.test_schedule_endpoints()
         self.test_stats_endpoint()
+        self.test_user_isolation()
+        self.test_recommendations_endpoint()
+        self.test_export_import_endpoints()
+        self.test_tuner_tunings_endpoint()
+        self.test_tuner_websocket()
+        self.test_catalog_snapshot()
         
         # Print results
         self.log(f"\n📊 RESULTS: {self.tests_passed}/{self.tests_run} tests passed")
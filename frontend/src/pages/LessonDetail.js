@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import { useParams, Link } from 'react-router-dom';
-import { ArrowLeft, CheckCircle2, Bookmark, BookmarkCheck, Lightbulb, Play, Dumbbell } from 'lucide-react';
+import { ArrowLeft, CheckCircle2, RotateCcw, Bookmark, BookmarkCheck, Lightbulb, Play, Dumbbell } from 'lucide-react';
 import { api } from '../utils/api';
 
 export default function LessonDetail() {
@@ -30,6 +30,11 @@ export default function LessonDetail() {
     setProgress(result);
   };
 
+  const markReviewed = async () => {
+    const result = await api.reviewProgress({ item_id: id, item_type: 'lesson' });
+    setProgress(result);
+  };
+
   const toggleBookmark = async () => {
     if (bookmarked) {
       await api.removeBookmark(bookmarkId);
@@ -64,6 +69,16 @@ export default function LessonDetail() {
           >
             {bookmarked ? <BookmarkCheck size={18} className="text-primary" /> : <Bookmark size={18} className="text-stone-400" />}
           </button>
+          {progress?.completed && (
+            <button
+              onClick={markReviewed}
+              data-testid="review-btn"
+              className="inline-flex items-center gap-2 px-4 py-2.5 rounded-full border border-stone-700 text-stone-300 hover:border-primary/30 font-body font-medium text-sm transition-colors"
+            >
+              <RotateCcw size={16} />
+              {progress.reviews ? `Reviewed (${progress.reviews})` : 'Mark Reviewed'}
+            </button>
+          )}
           <button
             onClick={toggleComplete}
             data-testid="complete-btn"
@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import { useParams, Link } from 'react-router-dom';
-import { ArrowLeft, CheckCircle2, Bookmark, BookmarkCheck, Lightbulb, Dumbbell } from 'lucide-react';
+import { ArrowLeft, CheckCircle2, RotateCcw, Bookmark, BookmarkCheck, Lightbulb, Dumbbell } from 'lucide-react';
 import { api } from '../utils/api';
 
 export default function TheoryDetail() {
@@ -30,6 +30,11 @@ export default function TheoryDetail() {
     setProgress(result);
   };
 
+  const markReviewed = async () => {
+    const result = await api.reviewProgress({ item_id: id, item_type: 'theory' });
+    setProgress(result);
+  };
+
   const toggleBookmark = async () => {
     if (bookmarked) {
       await api.removeBookmark(bookmarkId);
@@ -60,6 +65,16 @@ export default function TheoryDetail() {
           <button onClick={toggleBookmark} data-testid="bookmark-btn" className="p-2.5 rounded-xl border border-stone-700 hover:border-primary/30 transition-colors">
             {bookmarked ? <BookmarkCheck size={18} className="text-primary" /> : <Bookmark size={18} className="text-stone-400" />}
           </button>
+          {progress?.completed && (
+            <button
+              onClick={markReviewed}
+              data-testid="review-btn"
+              className="inline-flex items-center gap-2 px-4 py-2.5 rounded-full border border-stone-700 text-stone-300 hover:border-primary/30 font-body font-medium text-sm transition-colors"
+            >
+              <RotateCcw size={16} />
+              {progress.reviews ? `Reviewed (${progress.reviews})` : 'Mark Reviewed'}
+            </button>
+          )}
           <button
             onClick={toggleComplete}
             data-testid="complete-btn"
@@ -1,8 +1,33 @@
 const API_URL = process.env.REACT_APP_BACKEND_URL;
+const USER_ID_KEY = 'virtuoso_user_id';
+// Single-learner deployments keep using the "default" user that owns all pre-existing data;
+// set REACT_APP_MULTI_USER=true to give each browser its own learner id.
+const MULTI_USER = process.env.REACT_APP_MULTI_USER === 'true';
+const DEFAULT_USER_ID = 'default';
+
+function randomId() {
+  // crypto.randomUUID only exists in secure contexts (HTTPS / localhost)
+  if (window.crypto?.randomUUID) return window.crypto.randomUUID();
+  if (window.crypto?.getRandomValues) {
+    const bytes = window.crypto.getRandomValues(new Uint8Array(16));
+    return Array.from(bytes, (b) => b.toString(16).padStart(2, '0')).join('');
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+function getUserId() {
+  if (!MULTI_USER) return DEFAULT_USER_ID;
+  let id = localStorage.getItem(USER_ID_KEY);
+  if (!id) {
+    id = randomId();
+    localStorage.setItem(USER_ID_KEY, id);
+  }
+  return id;
+}
 
 async function fetchApi(endpoint, options = {}) {
   const res = await fetch(`${API_URL}${endpoint}`, {
-    headers: { 'Content-Type': 'application/json', ...options.headers },
+    headers: { 'Content-Type': 'application/json', 'X-User-Id': getUserId(), ...options.headers },
     ...options,
   });
   if (!res.ok) {
@@ -15,21 +40,22 @@ async function fetchApi(endpoint, options = {}) {
 export const api = {
   getHealth: () => fetchApi('/api/health'),
   getLessons: () => fetchApi('/api/lessons'),
-  getLesson: (id) => fetchApi(`/api/lessons/${id}`),
+  getLesson: (id) => fetchApi(`/api/lessons/${id}?format=structured`),
   getTheory: () => fetchApi('/api/theory'),
-  getTheoryTopic: (id) => fetchApi(`/api/theory/${id}`),
+  getTheoryTopic: (id) => fetchApi(`/api/theory/${id}?format=structured`),
   getSheetMusic: (params = {}) => {
     const q = new URLSearchParams(params).toString();
     return fetchApi(`/api/sheet-music${q ? `?${q}` : ''}`);
   },
   getSheetMusicPiece: (id) => fetchApi(`/api/sheet-music/${id}`),
   getCareGuides: () => fetchApi('/api/care-guides'),
-  getCareGuide: (id) => fetchApi(`/api/care-guides/${id}`),
+  getCareGuide: (id) => fetchApi(`/api/care-guides/${id}?format=structured`),
   getPracticeLogs: () => fetchApi('/api/practice-logs'),
   createPracticeLog: (data) => fetchApi('/api/practice-logs', { method: 'POST', body: JSON.stringify(data) }),
   deletePracticeLog: (id) => fetchApi(`/api/practice-logs/${id}`, { method: 'DELETE' }),
   getProgress: () => fetchApi('/api/progress'),
   updateProgress: (data) => fetchApi('/api/progress', { method: 'POST', body: JSON.stringify(data) }),
+  reviewProgress: (data) => fetchApi('/api/progress/review', { method: 'POST', body: JSON.stringify(data) }),
   getBookmarks: () => fetchApi('/api/bookmarks'),
   addBookmark: (data) => fetchApi('/api/bookmarks', { method: 'POST', body: JSON.stringify(data) }),
   removeBookmark: (id) => fetchApi(`/api/bookmarks/${id}`, { method: 'DELETE' }),
@@ -37,4 +63,5 @@ export const api = {
   createSchedule: (data) => fetchApi('/api/schedule', { method: 'POST', body: JSON.stringify(data) }),
   deleteSchedule: (id) => fetchApi(`/api/schedule/${id}`, { method: 'DELETE' }),
   getStats: () => fetchApi('/api/stats'),
+  getRecommendations: (limit = 10) => fetchApi(`/api/recommendations?limit=${limit}`),
 };